@@ -2,7 +2,7 @@ import argparse
 import json
 import os
 
-from common import BASE_IMAGES, IS_GA, THIS_DIR, versions_dict
+from common import IS_GA, THIS_DIR, versions
 
 ROOT_DIR = os.path.dirname(THIS_DIR)
 PLATFORMS = ["linux/amd64"]
@@ -13,24 +13,15 @@ def bake_file(version: str, testing: bool) -> dict:
     """
     Generate the contents of a docker-bake.json file.
     """
-    if version not in versions_dict():
+    if version not in versions():
         raise ValueError(f"Version {version} not found in versions.json")
 
-    version_info = versions_dict()[version]
+    version_info = versions()[version]
 
     if testing:
         tags = [f"webtrees:{version}-test"]
     else:
-        # build a list of tags. Use every base image with the version,
-        # plus any extra tags (e.g., latest)
-        tags = sorted(
-            [f"{bi}:{version}" for bi in BASE_IMAGES]
-            + [
-                f"{bi}:{tag}"
-                for bi in BASE_IMAGES
-                for tag in version_info["extra_tags"]
-            ]
-        )
+        tags = version_info.tags
 
     # https://docs.docker.com/build/bake/reference/
     webtrees_target = {
@@ -40,8 +31,8 @@ def bake_file(version: str, testing: bool) -> dict:
         "platforms": PLATFORMS,
         "args": {
             "WEBTREES_VERSION": version,
-            "PHP_VERSION": version_info["php"],
-            "UPGRADE_PATCH_VERSION": str(version_info["upgrade_patch"]),
+            "PHP_VERSION": version_info.php,
+            "UPGRADE_PATCH_VERSION": str(version_info.upgrade_patch),
         },
         "tags": tags,
     }
@@ -0,0 +1,363 @@
+import argparse
+import datetime
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from baker import ROOT_DIR, bake_file
+from common import THIS_DIR, versions
+
+IMAGE = "webtrees:bench"
+NAME = "webtrees-bench"
+TREE = "bench"
+DATA_DIR = "/var/www/webtrees/data"
+RESULTS_DIR = os.path.join(THIS_DIR, "bench")
+# individual and chart pages all start from the root of the generated tree
+PAGES = {
+    "home": "/",
+    "individual": f"/tree/{TREE}/individual/I1",
+    "chart": f"/tree/{TREE}/pedigree-right-4/I1",
+}
+# logged by the entrypoint once setup is done, just before Apache starts
+STARTING_APACHE = "[NV_INIT] Starting Apache"
+# seconds before a stalled request counts as an error
+REQUEST_TIMEOUT = 30
+# https://github.com/NathanVaughn/webtrees-docker/issues/164
+HEADERS = {"Cookie": "x=y", "User-Agent": "Chrome/"}
+# SQLite, so no external services are needed
+BASE_ENV = {
+    "PRETTY_URLS": "1",
+    "DB_TYPE": "sqlite",
+    "DB_NAME": "bench",
+    "WT_USER": "bench",
+    "WT_NAME": "Bench",
+    "WT_PASS": "benchpassword",
+    "WT_EMAIL": "bench@example.com",
+}
+
+
+def docker(*args: str, capture: bool = False) -> str:
+    """
+    Run a docker command, raising an error if it fails.
+    """
+    result = subprocess.run(
+        ["docker", *args], check=True, capture_output=capture, text=True
+    )
+    return result.stdout.strip() if capture else ""
+
+
+def build(version: str, php: str | None) -> None:
+    """
+    Build the image for the given version.
+    """
+    with open(os.path.join(ROOT_DIR, "docker-bake.json"), "w") as fp:
+        json.dump(bake_file(version=version, testing=True), fp, indent=4)
+
+    cmd = ["buildx", "bake", "webtrees", "--load", "--set", f"webtrees.tags={IMAGE}"]
+    if php is not None:
+        cmd.extend(["--set", f"webtrees.args.PHP_VERSION={php}"])
+
+    print(f"Building {version}")
+    subprocess.run(["docker", *cmd], check=True, cwd=ROOT_DIR)
+
+
+def apache_starts() -> int:
+    """
+    Count how many times the entrypoint has started the final Apache.
+    """
+    logs = subprocess.run(
+        ["docker", "logs", NAME],
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    ).stdout
+    # the setup wizard's temporary Apache logs "Starting Apache in background"
+    return sum(1 for line in logs.splitlines() if line == STARTING_APACHE)
+
+
+def wait_healthy(start: float, timeout: float, starts: int) -> float:
+    """
+    Wait until the entrypoint has started Apache for the given number of
+    times, and the container is healthy. Returns the seconds since start.
+    """
+    while time.monotonic() - start < timeout:
+        # the setup wizard's temporary Apache is also healthy, so don't
+        # trust the status until setup has finished
+        if apache_starts() >= starts:
+            status = docker(
+                "inspect", "--format", "{{.State.Health.Status}}", NAME, capture=True
+            )
+            if status == "healthy":
+                return time.monotonic() - start
+
+        time.sleep(0.25)
+
+    raise RuntimeError(f"Container was not healthy after {timeout} seconds")
+
+
+def gedcom(individuals: int) -> str:
+    """
+    Generate a GEDCOM file of a complete pedigree, where individual i
+    has the parents 2i and 2i + 1. Everyone is long dead, so visitors
+    can see them with the default privacy settings.
+    """
+    lines = [
+        "0 HEAD",
+        "1 SOUR bench",
+        "1 GEDC",
+        "2 VERS 5.5.1",
+        "2 FORM LINEAGE-LINKED",
+        "1 CHAR UTF-8",
+    ]
+
+    for i in range(1, individuals + 1):
+        lines.append(f"0 @I{i}@ INDI")
+        lines.append(f"1 NAME Person{i} /Bench{i}/")
+        lines.append(f"1 SEX {'M' if i == 1 or i % 2 == 0 else 'F'}")
+        lines.append("1 BIRT")
+        lines.append("2 DATE 1800")
+        lines.append("1 DEAT Y")
+        if 2 * i + 1 <= individuals:
+            lines.append(f"1 FAMC @F{i}@")
+        # only families with both parents are written
+        if i > 1 and 2 * (i // 2) + 1 <= individuals:
+            lines.append(f"1 FAMS @F{i // 2}@")
+
+    for i in range(1, individuals // 2 + 1):
+        if 2 * i + 1 > individuals:
+            break
+
+        lines.append(f"0 @F{i}@ FAM")
+        lines.append(f"1 HUSB @I{2 * i}@")
+        lines.append(f"1 WIFE @I{2 * i + 1}@")
+        lines.append(f"1 CHIL @I{i}@")
+
+    lines.append("0 TRLR")
+    return "\n".join(lines) + "\n"
+
+
+def load_tree(individuals: int) -> None:
+    """
+    Create the benchmark tree and import a generated GEDCOM file into it.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "bench.ged")
+        with open(filename, "w") as fp:
+            fp.write(gedcom(individuals))
+
+        docker("cp", filename, f"{NAME}:{DATA_DIR}/bench.ged")
+
+    print(f"Importing {individuals} individuals")
+    # the tree may already exist if the volume was reused
+    subprocess.run(
+        ["docker", "exec", "-u", "www-data", NAME, "php", "index.php"]
+        + ["tree-create", TREE, "Bench"]
+    )
+    docker(
+        "exec",
+        NAME,
+        "python3",
+        "/docker-entrypoint.py",
+        "import",
+        f"{DATA_DIR}/bench.ged",
+        "--tree",
+        TREE,
+    )
+
+
+def fetch(url: str) -> tuple[float, bool]:
+    """
+    Request a URL. Returns the seconds taken, and if it was successful.
+    """
+    start = time.perf_counter()
+
+    try:
+        with urllib.request.urlopen(
+            urllib.request.Request(url, headers=HEADERS), timeout=REQUEST_TIMEOUT
+        ) as r:
+            r.read()
+            ok = r.status == 200
+    # URLError and timeouts are OSErrors. Errors reading the response,
+    # such as a dropped connection, are not wrapped by urllib
+    except (OSError, http.client.HTTPException):
+        ok = False
+
+    return time.perf_counter() - start, ok
+
+
+def load(url: str, requests: int, concurrency: int, warmup: int) -> dict:
+    """
+    Send a fixed number of requests to a URL at a fixed concurrency.
+    """
+    for _ in range(warmup):
+        fetch(url)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(fetch, [url] * requests))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(t for t, ok in results if ok)
+    errors = sum(1 for _, ok in results if not ok)
+
+    if len(latencies) < 2:
+        raise RuntimeError(f"Too few successful requests to {url}")
+
+    quantiles = statistics.quantiles(latencies, n=100)
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50": quantiles[49],
+        "p95": quantiles[94],
+        "p99": quantiles[98],
+    }
+
+
+def main(
+    version: str,
+    php: str | None,
+    env: dict[str, str],
+    port: int,
+    individuals: int,
+    requests: int,
+    concurrency: int,
+    warmup: int,
+    timeout: float,
+    skip_build: bool,
+    output: str | None,
+) -> None:
+    """
+    Benchmark the startup time and request throughput of an image.
+    """
+    if version not in versions():
+        raise ValueError(f"Version {version} not found in versions.json")
+
+    php = php or versions()[version].php
+
+    if not skip_build:
+        build(version=version, php=php)
+
+    container_env = {**BASE_ENV, "BASE_URL": f"http://127.0.0.1:{port}", **env}
+    volume = f"{NAME}-data"
+    result: dict = {
+        "version": version,
+        "php": php,
+        "env": env,
+        "date": datetime.datetime.now(datetime.UTC).isoformat(),
+        "load": {"requests": requests, "concurrency": concurrency},
+    }
+
+    docker("volume", "create", volume)
+
+    try:
+        # cold start, with an empty volume
+        run_args = ["run", "-d", "--name", NAME, "-p", f"127.0.0.1:{port}:80"]
+        run_args.extend(["-v", f"{volume}:{DATA_DIR}"])
+        # the default healthcheck interval is far too coarse to time startup
+        run_args.extend(["--health-interval", "1s", "--health-start-period", "0s"])
+        for key, value in container_env.items():
+            run_args.extend(["-e", f"{key}={value}"])
+
+        print("Starting container with a cold volume")
+        start = time.monotonic()
+        docker(*run_args, IMAGE)
+        cold = wait_healthy(start, timeout, starts=1)
+        print(f"Healthy in {cold:.2f} seconds")
+
+        # warm start, reusing the set up volume
+        docker("stop", NAME)
+        print("Starting container with a warm volume")
+        start = time.monotonic()
+        docker("start", NAME)
+        warm = wait_healthy(start, timeout, starts=2)
+        print(f"Healthy in {warm:.2f} seconds")
+
+        result["startup"] = {"cold": cold, "warm": warm}
+
+        load_tree(individuals)
+
+        result["pages"] = {}
+        for page, path in PAGES.items():
+            print(f"Loading {page} page")
+            stats = load(
+                f"http://127.0.0.1:{port}{path}",
+                requests=requests,
+                concurrency=concurrency,
+                warmup=warmup,
+            )
+            print(
+                f"{stats['rps']:.1f} req/s, p50 {stats['p50'] * 1000:.0f}ms,"
+                f" p95 {stats['p95'] * 1000:.0f}ms, p99 {stats['p99'] * 1000:.0f}ms"
+                f", {stats['errors']} errors"
+            )
+            result["pages"][page] = stats
+    finally:
+        subprocess.run(["docker", "rm", "-f", NAME], capture_output=True)
+        subprocess.run(["docker", "volume", "rm", volume], capture_output=True)
+
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{version}-php{php}-{timestamp}.json")
+
+    with open(output, "w") as fp:
+        json.dump(result, fp, indent=4)
+
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--version", type=str, required=True, help="Version to test")
+    parser.add_argument("--php", type=str, help="Override the PHP version")
+    parser.add_argument(
+        "--env",
+        type=str,
+        action="append",
+        default=[],
+        help="Extra container environment variable as KEY=VALUE",
+    )
+    parser.add_argument("--port", type=int, default=8089, help="Local port to use")
+    parser.add_argument(
+        "--individuals", type=int, default=1000, help="Size of the generated tree"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=500, help="Requests to send to each page"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="Requests to send at once"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=10, help="Unmeasured requests for each page"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=300, help="Seconds to wait to be healthy"
+    )
+    parser.add_argument(
+        "--skip-build", action="store_true", help="Use the previously built image"
+    )
+    parser.add_argument("--output", type=str, help="JSON file to save results to")
+    args = parser.parse_args()
+
+    main(
+        version=args.version,
+        php=args.php,
+        env=dict(e.split("=", 1) for e in args.env),
+        port=args.port,
+        individuals=args.individuals,
+        requests=args.requests,
+        concurrency=args.concurrency,
+        warmup=args.warmup,
+        timeout=args.timeout,
+        skip_build=args.skip_build,
+        output=args.output,
+    )
@@ -2,7 +2,7 @@ import json
 import os
 import urllib.request
 
-from common import versions_dict
+from common import versions
 
 
 def main() -> None:
@@ -29,8 +29,7 @@ def main() -> None:
             upstream_versions.append(release["tag_name"])
 
     # filter out versions we already know about
-    known_versions = versions_dict().keys()
-    print(json.dumps([v for v in upstream_versions if v not in known_versions]))
+    print(json.dumps([v for v in upstream_versions if v not in versions()]))
 
 
 if __name__ == "__main__":
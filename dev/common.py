@@ -1,6 +1,9 @@
+import datetime
 import functools
 import json
 import os
+import re
+from dataclasses import dataclass, field
 
 THIS_DIR = os.path.dirname(os.path.abspath(__file__))
 BASE_IMAGES = [
@@ -10,10 +13,171 @@ BASE_IMAGES = [
 
 IS_GA = os.getenv("GITHUB_ACTIONS") == "true"
 
+VERSION_RE = re.compile(r"^(\d+)\.(\d+)\.(\d+)(?:-(alpha|beta)\.\d+)?$")
+PHP_RE = re.compile(r"^\d+\.\d+$")
+TAG_RE = re.compile(r"^[\w][\w.-]{0,127}$")
+# key name -> expected type
+SCHEMA = {
+    "version": str,
+    "php": str,
+    "upgrade_patch": int,
+    "created": str,
+    "prerelease": bool,
+    "extra_tags": list,
+}
 
-@functools.cache
-def versions_dict() -> dict:
-    with open(os.path.join(THIS_DIR, "versions.json")) as f:
+
+@dataclass(frozen=True, slots=True)
+class Version:
+    version: str
+    php: str
+    upgrade_patch: int
+    created: str
+    prerelease: bool
+    extra_tags: tuple[str, ...]
+    # derived from the version string
+    major: str = field(init=False)
+    minor: str = field(init=False)
+
+    def __post_init__(self) -> None:
+        match = VERSION_RE.match(self.version)
+        if match is None:
+            raise ValueError(f"Invalid version string {self.version!r}")
+
+        object.__setattr__(self, "major", match.group(1))
+        object.__setattr__(self, "minor", f"{match.group(1)}.{match.group(2)}")
+
+    @property
+    def tags(self) -> list[str]:
+        """
+        Every fully qualified image tag for this version. Use every base image
+        with the version, plus any extra tags (e.g., latest)
+        """
+        return sorted(
+            f"{bi}:{tag}"
+            for bi in BASE_IMAGES
+            for tag in (self.version, *self.extra_tags)
+        )
+
+
+def parse_version(data: dict) -> Version:
+    """
+    Validate a single raw versions.json entry and convert it to a Version.
+    """
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected an object, got {type(data).__name__}")
+
+    name = data.get("version", "<unknown>")
+
+    missing = SCHEMA.keys() - data.keys()
+    if missing:
+        raise ValueError(f"{name}: missing keys {sorted(missing)}")
+
+    extra = data.keys() - SCHEMA.keys()
+    if extra:
+        raise ValueError(f"{name}: unknown keys {sorted(extra)}")
+
+    for key, type_ in SCHEMA.items():
+        # bool is a subclass of int, so check exact types
+        if type(data[key]) is not type_:
+            raise ValueError(
+                f"{name}: {key} must be {type_.__name__}, got {type(data[key]).__name__}"
+            )
+
+    if not PHP_RE.match(data["php"]):
+        raise ValueError(f"{name}: invalid php version {data['php']!r}")
+
+    try:
+        datetime.datetime.fromisoformat(data["created"])
+    except ValueError:
+        raise ValueError(f"{name}: invalid created timestamp {data['created']!r}")
+
+    for tag in data["extra_tags"]:
+        if not isinstance(tag, str) or not TAG_RE.match(tag):
+            raise ValueError(f"{name}: invalid extra tag {tag!r}")
+
+    # alpha and beta versions are prereleases, and nothing else is
+    match = VERSION_RE.match(data["version"])
+    if match is not None and (match.group(4) is not None) != data["prerelease"]:
+        raise ValueError(
+            f"{name}: prerelease is {data['prerelease']}, which does not match the version"
+        )
+
+    if data["prerelease"] and "latest" in data["extra_tags"]:
+        raise ValueError(f"{name}: a prerelease can not be tagged 'latest'")
+
+    return Version(
+        version=data["version"],
+        php=data["php"],
+        upgrade_patch=data["upgrade_patch"],
+        created=data["created"],
+        prerelease=data["prerelease"],
+        extra_tags=tuple(data["extra_tags"]),
+    )
+
+
+class Versions:
+    """
+    Validated contents of versions.json, with precomputed lookup indexes.
+    """
+
+    __slots__ = (
+        "all",
+        "by_version",
+        "by_php",
+        "by_major",
+        "by_minor",
+        "by_prerelease",
+        "by_tag",
+    )
+
+    def __init__(self, entries: list[Version]) -> None:
+        self.all = tuple(entries)
+        self.by_version: dict[str, Version] = {}
+        self.by_php: dict[str, list[Version]] = {}
+        self.by_major: dict[str, list[Version]] = {}
+        self.by_minor: dict[str, list[Version]] = {}
+        self.by_prerelease: dict[bool, list[Version]] = {True: [], False: []}
+        # tag (version or extra tag) -> version that owns it
+        self.by_tag: dict[str, Version] = {}
+
+        for entry in self.all:
+            if entry.version in self.by_version:
+                raise ValueError(f"Duplicate version {entry.version}")
+            self.by_version[entry.version] = entry
+
+            self.by_php.setdefault(entry.php, []).append(entry)
+            self.by_major.setdefault(entry.major, []).append(entry)
+            self.by_minor.setdefault(entry.minor, []).append(entry)
+            self.by_prerelease[entry.prerelease].append(entry)
+
+            for tag in (entry.version, *entry.extra_tags):
+                if tag in self.by_tag:
+                    raise ValueError(
+                        f"Tag {tag!r} claimed by both {self.by_tag[tag].version} and {entry.version}"
+                    )
+                self.by_tag[tag] = entry
+
+    def __contains__(self, version: str) -> bool:
+        return version in self.by_version
+
+    def __getitem__(self, version: str) -> Version:
+        return self.by_version[version]
+
+
+def load_versions(path: str) -> Versions:
+    """
+    Load and validate a versions.json file.
+    """
+    with open(path) as f:
         data = json.load(f)
 
-    return {d["version"]: d for d in data}
+    if not isinstance(data, list):
+        raise ValueError(f"{path}: expected a list of versions")
+
+    return Versions([parse_version(d) for d in data])
+
+
+@functools.cache
+def versions() -> Versions:
+    return load_versions(os.path.join(THIS_DIR, "versions.json"))
@@ -2,23 +2,19 @@ import argparse
 import json
 import os
 
-from common import BASE_IMAGES, IS_GA, versions_dict
+from common import BASE_IMAGES, IS_GA, versions
 
 
 def main(version: str) -> None:
     """
     Generate metadata for the given version to be used in CI steps.
     """
-    version_info = versions_dict()[version]
-
-    tags = sorted(
-        [f"{bi}:{version}" for bi in BASE_IMAGES]
-        + [f"{bi}:{tag}" for bi in BASE_IMAGES for tag in version_info["extra_tags"]]
-    )
+    version_info = versions()[version]
+    tags = version_info.tags
 
     output_data = {
         "release_tag": version,
-        "prerelease": version_info["prerelease"],
+        "prerelease": version_info.prerelease,
         "release_body": f"Release for webtrees version {version}: https://github.com/fisharebest/webtrees/releases/tag/{version}\n\nTags pushed:\n{'\n'.join(f'- {tag}' for tag in tags)}",
         "base_images": BASE_IMAGES,
         "tags": ",".join(tags),
@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+from dataclasses import asdict
+
+from common import IS_GA, Version, versions
+
+
+def select(
+    php: str | None,
+    major: str | None,
+    minor: str | None,
+    prerelease: bool | None,
+    tag: str | None,
+) -> list[Version]:
+    """
+    Select versions matching all of the given filters.
+    """
+    index = versions()
+
+    if tag is not None:
+        selected = [index.by_tag[tag]] if tag in index.by_tag else []
+    elif minor is not None:
+        selected = index.by_minor.get(minor, [])
+    elif major is not None:
+        selected = index.by_major.get(major, [])
+    elif php is not None:
+        selected = index.by_php.get(php, [])
+    elif prerelease is not None:
+        selected = index.by_prerelease[prerelease]
+    else:
+        selected = list(index.all)
+
+    # remaining filters are applied to the (much smaller) indexed selection
+    return [
+        v
+        for v in selected
+        if (php is None or v.php == php)
+        and (major is None or v.major == major)
+        and (minor is None or v.minor == minor)
+        and (prerelease is None or v.prerelease == prerelease)
+    ]
+
+
+def main(
+    php: str | None,
+    major: str | None,
+    minor: str | None,
+    prerelease: bool | None,
+    tag: str | None,
+    field: str | None,
+) -> None:
+    """
+    Output the matching versions as JSON, for use as a CI build matrix.
+    """
+    selected = select(
+        php=php, major=major, minor=minor, prerelease=prerelease, tag=tag
+    )
+
+    # an empty build matrix is an error in GitHub Actions, so fail clearly here
+    if not selected:
+        raise ValueError("No versions in versions.json match the given filters")
+
+    if field is not None:
+        output_data = [getattr(v, field) for v in selected]
+    else:
+        output_data = [asdict(v) for v in selected]
+
+    if IS_GA:
+        with open(os.environ["GITHUB_OUTPUT"], "w") as fp:
+            fp.write(f"matrix={json.dumps(output_data)}")
+    else:
+        print(json.dumps(output_data, indent=4))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--php", type=str, help="Only versions using this PHP version")
+    parser.add_argument("--major", type=str, help="Only versions in this major line")
+    parser.add_argument("--minor", type=str, help="Only versions in this minor line")
+    parser.add_argument("--tag", type=str, help="Only the version owning this tag")
+    release_group = parser.add_mutually_exclusive_group()
+    release_group.add_argument(
+        "--prerelease",
+        action="store_const",
+        const=True,
+        dest="prerelease",
+        help="Only prerelease versions",
+    )
+    release_group.add_argument(
+        "--stable",
+        action="store_const",
+        const=False,
+        dest="prerelease",
+        help="Only stable versions",
+    )
+    parser.add_argument(
+        "--field",
+        type=str,
+        choices=["version", "php", "major", "minor", "created", "upgrade_patch"],
+        help="Only output this field of each version",
+    )
+    args = parser.parse_args()
+
+    main(
+        php=args.php,
+        major=args.major,
+        minor=args.minor,
+        prerelease=args.prerelease,
+        tag=args.tag,
+        field=args.field,
+    )
@@ -1,12 +1,30 @@
+import argparse
+import fcntl
+import json
+import math
 import os
 import socket
 import subprocess
 import sys
+import tempfile
 import time
 import urllib.error
-from dataclasses import dataclass
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from typing import Any, List, Literal, Optional, TypeVar, Union, overload
+from functools import cached_property
+from typing import (
+    Any,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    TextIO,
+    Tuple,
+    TypeVar,
+    Union,
+    overload,
+)
 from urllib import request
 from urllib.parse import urlencode
 
@@ -22,39 +40,9 @@ class DBType(Enum):
     sqlite = "sqlite"
 
 
-@dataclass
-class EnvVars:
-    prettyurls: bool
-    https: bool
-    httpsredirect: bool
-    sslcertfile: str
-    sslcertkeyfile: str
-    lang: str
-    baseurl: Optional[str]
-    dbtype: DBType
-    dbhost: Optional[str]
-    dbport: str
-    dbuser: str
-    dbpass: Optional[str]
-    dbname: str
-    tblpfx: str
-    wtuser: Optional[str]
-    wtname: Optional[str]
-    wtpass: Optional[str]
-    wtemail: Optional[str]
-    # https://github.com/fisharebest/webtrees/blob/f9a3af650116d75f1a87f454cabff5e9047e43f3/app/Http/Middleware/UseDatabase.php#L71-L82
-    dbkey: Optional[str]
-    dbcert: Optional[str]
-    dbca: Optional[str]
-    dbverify: bool
-    # php settings
-    phpmemorylimit: str
-    phpmaxexecutiontime: str
-    phppostmaxsize: str
-    phpuploadmaxfilesize: str
-    # user/group ID
-    puid: str
-    pgid: str
+class Role(Enum):
+    primary = "primary"
+    replica = "replica"
 
 
 def truish(value: Optional[str]) -> bool:
@@ -76,32 +64,50 @@ def print2(msg: Any) -> None:
 
 T = TypeVar("T")
 
+# environment variable name -> how it was resolved, for the startup report
+RESOLVED: Dict[str, str] = {}
+# values of these variables are never shown in the startup report
+SECRETS = {"DB_PASS", "WT_PASS"}
+
 
 @overload
 def get_environment_variable(
-    key: str, default: None = None, alternates: Optional[List[str]] = None
+    key: str,
+    default: None = None,
+    alternates: Optional[List[str]] = None,
+    secret: bool = False,
 ) -> Optional[str]: ...
 
 
 @overload
 def get_environment_variable(
-    key: str, default: T = None, alternates: Optional[List[str]] = None
+    key: str,
+    default: T = None,
+    alternates: Optional[List[str]] = None,
+    secret: bool = False,
 ) -> T: ...
 
 
 def get_environment_variable(
-    key: str, default: Optional[T] = None, alternates: Optional[List[str]] = None
+    key: str,
+    default: Optional[T] = None,
+    alternates: Optional[List[str]] = None,
+    secret: bool = False,
 ) -> Union[Optional[str], T]:
     """
     Try to find the value of an environment variable.
     """
     key = key.upper()
+    secret = secret or key in SECRETS
+
+    def shown(value: Any) -> str:
+        return "<redacted>" if secret and value is not None else repr(value)
 
     # try to find variable in env
     if key in os.environ:
         value = os.environ[key]
 
-        print2(f"{key} found in environment variables")
+        RESOLVED[key] = f"environment variable {shown(value)}"
         return value
 
     # try to find file version of variable
@@ -110,79 +116,260 @@ def get_environment_variable(
     if file_key in os.environ:
         # file name does not exist
         if not os.path.isfile(os.environ[file_key]):
-            print(f"WARNING: {file_key} is not a file: {os.environ[file_key]}")
+            RESOLVED[key] = f"WARNING: {file_key} is not a file: {os.environ[file_key]}"
             return None
 
         # read data from file
         with open(os.environ[file_key], "r") as f:
             value = f.read().strip()
 
-        print2(f"{file_key} found in environment variables")
+        RESOLVED[key] = f"{file_key} {shown(value)}"
         return value
 
     # try to find alternate variable
     if alternates is not None:
         for a in alternates:
-            a_value = get_environment_variable(a)
+            a_value = get_environment_variable(a, secret=secret)
             if a_value is not None:
+                RESOLVED[key] = f"alternate {a}"
                 return a_value
 
+            # only report alternates that were used
+            if RESOLVED[a].startswith("default"):
+                del RESOLVED[a]
+
     # return default value
-    print2(f"{key} NOT found in environment variables, using default: {default}")
+    RESOLVED[key] = f"default {shown(default)}"
     return default
 
 
-ENV = EnvVars(
-    prettyurls=truish(get_environment_variable("PRETTY_URLS")),
-    https=truish(get_environment_variable("HTTPS", alternates=["SSL"])),
-    httpsredirect=truish(
-        get_environment_variable("HTTPS_REDIRECT", alternates=["SSL_REDIRECT"])
-    ),
-    sslcertfile=get_environment_variable("SSL_CERT_FILE", "/certs/webtrees.crt"),
-    sslcertkeyfile=get_environment_variable("SSL_CERT_KEY_FILE", "/certs/webtrees.key"),
-    baseurl=get_environment_variable("BASE_URL"),
-    lang=get_environment_variable("LANG", "en-US"),
-    dbtype=DBType[get_environment_variable("DB_TYPE", "mysql")],
-    dbhost=get_environment_variable("DB_HOST"),
-    dbport=get_environment_variable("DB_PORT", "3306"),
-    dbuser=get_environment_variable(
-        "DB_USER",
-        "webtrees",
-        alternates=["MYSQL_USER", "MARIADB_USER", "POSTGRES_USER"],
-    ),
-    dbpass=get_environment_variable(
-        "DB_PASS",
-        alternates=["MYSQL_PASSWORD", "MARIADB_PASSWORD", "POSTGRES_PASSWORD"],
-    ),
-    dbname=get_environment_variable(
-        "DB_NAME",
-        default="webtrees",
-        alternates=["MYSQL_DATABASE", "MARIADB_DATABASE", "POSTGRES_DB"],
-    ),
-    tblpfx=get_environment_variable("DB_PREFIX", "wt_"),
-    wtuser=get_environment_variable("WT_USER"),
-    wtname=get_environment_variable("WT_NAME"),
-    wtpass=get_environment_variable("WT_PASS"),
-    wtemail=get_environment_variable("WT_EMAIL"),
-    dbkey=get_environment_variable("DB_KEY"),
-    dbcert=get_environment_variable("DB_CERT"),
-    dbca=get_environment_variable("DB_CA"),
-    dbverify=truish(get_environment_variable("DB_VERIFY")),
-    phpmemorylimit=get_environment_variable("PHP_MEMORY_LIMIT", "1024M"),
-    phpmaxexecutiontime=get_environment_variable("PHP_MAX_EXECUTION_TIME", "90"),
-    phppostmaxsize=get_environment_variable("PHP_POST_MAX_SIZE", "50M"),
-    phpuploadmaxfilesize=get_environment_variable("PHP_UPLOAD_MAX_FILE_SIZE", "50M"),
-    puid=get_environment_variable("PUID", "33"),  # www-data user
-    pgid=get_environment_variable("PGID", "33"),
-)
+class EnvVars:
+    """
+    Settings from environment variables. Each one is only looked up the
+    first time it is used, and can be overridden by assignment.
+    """
+
+    @cached_property
+    def prettyurls(self) -> bool:
+        return truish(get_environment_variable("PRETTY_URLS"))
+
+    @cached_property
+    def https(self) -> bool:
+        return truish(get_environment_variable("HTTPS", alternates=["SSL"]))
+
+    @cached_property
+    def httpsredirect(self) -> bool:
+        return truish(
+            get_environment_variable("HTTPS_REDIRECT", alternates=["SSL_REDIRECT"])
+        )
+
+    @cached_property
+    def sslcertfile(self) -> str:
+        return get_environment_variable("SSL_CERT_FILE", "/certs/webtrees.crt")
+
+    @cached_property
+    def sslcertkeyfile(self) -> str:
+        return get_environment_variable("SSL_CERT_KEY_FILE", "/certs/webtrees.key")
+
+    @cached_property
+    def lang(self) -> str:
+        return get_environment_variable("LANG", "en-US")
+
+    @cached_property
+    def baseurl(self) -> Optional[str]:
+        return get_environment_variable("BASE_URL")
+
+    @cached_property
+    def dbtype(self) -> DBType:
+        return DBType[get_environment_variable("DB_TYPE", "mysql")]
+
+    @cached_property
+    def dbhost(self) -> Optional[str]:
+        return get_environment_variable("DB_HOST")
+
+    @cached_property
+    def dbport(self) -> str:
+        return get_environment_variable("DB_PORT", "3306")
+
+    @cached_property
+    def dbuser(self) -> str:
+        return get_environment_variable(
+            "DB_USER",
+            "webtrees",
+            alternates=["MYSQL_USER", "MARIADB_USER", "POSTGRES_USER"],
+        )
+
+    @cached_property
+    def dbpass(self) -> Optional[str]:
+        return get_environment_variable(
+            "DB_PASS",
+            alternates=["MYSQL_PASSWORD", "MARIADB_PASSWORD", "POSTGRES_PASSWORD"],
+        )
+
+    @cached_property
+    def dbname(self) -> str:
+        return get_environment_variable(
+            "DB_NAME",
+            default="webtrees",
+            alternates=["MYSQL_DATABASE", "MARIADB_DATABASE", "POSTGRES_DB"],
+        )
+
+    @cached_property
+    def tblpfx(self) -> str:
+        return get_environment_variable("DB_PREFIX", "wt_")
+
+    @cached_property
+    def wtuser(self) -> Optional[str]:
+        return get_environment_variable("WT_USER")
+
+    @cached_property
+    def wtname(self) -> Optional[str]:
+        return get_environment_variable("WT_NAME")
+
+    @cached_property
+    def wtpass(self) -> Optional[str]:
+        return get_environment_variable("WT_PASS")
+
+    @cached_property
+    def wtemail(self) -> Optional[str]:
+        return get_environment_variable("WT_EMAIL")
+
+    # https://github.com/fisharebest/webtrees/blob/f9a3af650116d75f1a87f454cabff5e9047e43f3/app/Http/Middleware/UseDatabase.php#L71-L82
+    @cached_property
+    def dbkey(self) -> Optional[str]:
+        return get_environment_variable("DB_KEY")
+
+    @cached_property
+    def dbcert(self) -> Optional[str]:
+        return get_environment_variable("DB_CERT")
+
+    @cached_property
+    def dbca(self) -> Optional[str]:
+        return get_environment_variable("DB_CA")
+
+    @cached_property
+    def dbverify(self) -> bool:
+        return truish(get_environment_variable("DB_VERIFY"))
+
+    # unix socket to use instead of TCP when the database is co-located
+    @cached_property
+    def dbsocket(self) -> Optional[str]:
+        return get_environment_variable("DB_SOCKET")
+
+    @cached_property
+    def dbpersistent(self) -> bool:
+        return truish(get_environment_variable("DB_PERSISTENT"))
+
+    @cached_property
+    def dbconnecttimeout(self) -> str:
+        value = get_environment_variable("DB_CONNECT_TIMEOUT", "10")
+
+        # the database tools fail on every attempt with a bad value,
+        # so the startup probe would wait forever
+        if not value.strip().isdigit() or int(value) <= 0:
+            print2(
+                f"ERROR: DB_CONNECT_TIMEOUT must be a positive number of seconds, got '{value}'"
+            )
+            sys.exit(1)
+
+        return str(int(value))
+
+    # php settings
+    @cached_property
+    def phpmemorylimit(self) -> str:
+        return get_environment_variable("PHP_MEMORY_LIMIT", "1024M")
+
+    @cached_property
+    def phpmaxexecutiontime(self) -> str:
+        return get_environment_variable("PHP_MAX_EXECUTION_TIME", "90")
+
+    @cached_property
+    def phppostmaxsize(self) -> str:
+        return get_environment_variable("PHP_POST_MAX_SIZE", "50M")
+
+    @cached_property
+    def phpuploadmaxfilesize(self) -> str:
+        return get_environment_variable("PHP_UPLOAD_MAX_FILE_SIZE", "50M")
+
+    # user/group ID
+    @cached_property
+    def puid(self) -> str:
+        return get_environment_variable("PUID", "33")  # www-data user
+
+    @cached_property
+    def pgid(self) -> str:
+        return get_environment_variable("PGID", "33")
+
+    # only the primary sets up the shared data directory
+    @cached_property
+    def role(self) -> Role:
+        value = get_environment_variable("ROLE", "primary")
+
+        if value not in Role.__members__:
+            print2(
+                f"ERROR: ROLE must be one of {', '.join(Role.__members__)}, got '{value}'"
+            )
+            sys.exit(1)
+
+        return Role[value]
+
+    def report(self) -> None:
+        """
+        Resolve every setting, and print how each environment variable
+        was found in a single message
+        """
+        for name, value in vars(EnvVars).items():
+            if isinstance(value, cached_property):
+                getattr(self, name)
+
+        width = max(len(k) for k in RESOLVED)
+        lines = [f"  {k.ljust(width)}  {v}" for k, v in sorted(RESOLVED.items())]
+        print2("Environment variables:\n" + "\n".join(lines))
+
+
+ENV = EnvVars()
 
 
 ROOT = "/var/www/webtrees"
 DATA_DIR = os.path.join(ROOT, "data")
 CONFIG_FILE = os.path.join(DATA_DIR, "config.ini.php")
 PHP_INI_FILE = "/usr/local/etc/php/php.ini"
-
-os.chdir(ROOT)
+# seconds to keep retrying a database host that can't be resolved,
+# or a database socket that doesn't exist
+DB_LOOKUP_TIMEOUT = 60
+# patched at build time to read the NV_DB_ connection options (webtrees 2.2+)
+DB_FILE = os.path.join(ROOT, "app", "DB.php")
+# held by the primary for as long as it runs, and contains its run token
+LOCK_FILE = os.path.join(DATA_DIR, ".entrypoint.lock")
+# created by the primary once the data directory is ready for replicas,
+# and contains the same run token
+READY_FILE = os.path.join(DATA_DIR, ".primary-ready")
+# only available in webtrees 2.2+
+CLI_DIR = os.path.join(ROOT, "app", "Cli")
+
+# PHP settings used for long-running command line jobs. These are passed
+# as -d flags, so only apply to that process and never touch php.ini
+BULK_PHP_SETTINGS = {
+    "memory_limit": "-1",
+    "max_execution_time": "0",
+    "post_max_size": "0",
+    "upload_max_filesize": "0",
+}
+# larger mysqlnd client buffers, so bulk inserts need fewer round trips
+BULK_MYSQL_PHP_SETTINGS = {
+    "mysqlnd.net_cmd_buffer_size": "1048576",
+    "mysqlnd.net_read_buffer_size": "1048576",
+}
+
+MEDIA_DIR = os.path.join(DATA_DIR, "media")
+MEDIA_WARM_SCRIPT = "/media-warm.php"
+MEDIA_WARM_MANIFEST = os.path.join(DATA_DIR, ".media-warm.json")
+# thumbnail sizes from webtrees' displayImage() calls: chart boxes,
+# the individual page, and media linked to facts
+MEDIA_WARM_SIZES = ["40x50:crop", "200x260:contain", "100x100:contain"]
+# displayImage() also lists these multiples in the srcset for high density displays
+MEDIA_WARM_DENSITIES = [1, 2, 3, 4]
+MEDIA_EXTENSIONS = {".bmp", ".gif", ".jpeg", ".jpg", ".png", ".tif", ".tiff", ".webp"}
 
 
 def retry_urlopen(url: str, data: bytes) -> None:
@@ -323,15 +510,22 @@ def enable_apache_site(
         )
 
 
+def user_ids() -> None:
+    """
+    Set the web server user and group IDs
+    """
+    # https://github.com/linuxserver/docker-baseimage-alpine/blob/bef0f4cee208396c92c0fdd1426613de02698301/root/etc/s6-overlay/s6-rc.d/init-adduser/run#L4-L9
+    subprocess.check_call(["groupmod", "-o", "-g", ENV.pgid, "www-data"])
+    subprocess.check_call(["usermod", "-o", "-u", ENV.puid, "www-data"])
+
+
 def perms() -> None:
     """
     Set up folder permissions
     """
 
     print2("Setting up folder permissions for uploads")
-    # https://github.com/linuxserver/docker-baseimage-alpine/blob/bef0f4cee208396c92c0fdd1426613de02698301/root/etc/s6-overlay/s6-rc.d/init-adduser/run#L4-L9
-    subprocess.check_call(["groupmod", "-o", "-g", ENV.pgid, "www-data"])
-    subprocess.check_call(["usermod", "-o", "-u", ENV.puid, "www-data"])
+    user_ids()
     subprocess.check_call(["chown", "-R", "www-data:www-data", DATA_DIR])
 
     if os.path.isfile(CONFIG_FILE):
@@ -356,6 +550,10 @@ def php_ini() -> None:
     set_php_ini_value("post_max_size", ENV.phppostmaxsize)
     set_php_ini_value("upload_max_filesize", ENV.phpuploadmaxfilesize)
 
+    # PDO uses this socket when connecting to MySQL on "localhost"
+    if ENV.dbtype == DBType.mysql and ENV.dbsocket is not None:
+        set_php_ini_value("pdo_mysql.default_socket", ENV.dbsocket)
+
     # https://webtrees.net/admin/performance/
     set_php_ini_value("opcache.enable", "1")
     set_php_ini_value("opcache.revalidate_freq", "60") # re check changed files every 60 seconds
@@ -377,6 +575,14 @@ def check_db_variables() -> bool:
             ENV.dbuser = ""
             ENV.dbpass = ""
 
+        # connect over the unix socket instead of TCP
+        if ENV.dbsocket is not None:
+            if ENV.dbtype == DBType.mysql:
+                ENV.dbhost = "localhost"
+            elif ENV.dbtype == DBType.pgsql:
+                # libpq takes the directory containing the socket as the host
+                ENV.dbhost = ENV.dbsocket
+
         assert ENV.dbhost is not None
         assert ENV.dbport is not None
         assert ENV.dbuser is not None
@@ -389,6 +595,115 @@ def check_db_variables() -> bool:
     return True
 
 
+def database_connection_options() -> None:
+    """
+    Pass the database connection options to PHP. Apache and command line
+    PHP processes inherit these from the entrypoint
+    """
+    os.environ["NV_DB_PERSISTENT"] = str(int(ENV.dbpersistent))
+
+    if ENV.dbtype in [DBType.mysql, DBType.pgsql]:
+        os.environ["NV_DB_CONNECT_TIMEOUT"] = ENV.dbconnecttimeout
+        # libpq also reads this, for webtrees versions without the patch
+        os.environ["PGCONNECT_TIMEOUT"] = ENV.dbconnecttimeout
+
+    patched = False
+    if os.path.isfile(DB_FILE):
+        with open(DB_FILE, "r") as fp:
+            patched = "NV_DB_PERSISTENT" in fp.read()
+
+    if ENV.dbpersistent and not patched:
+        print2("WARNING: DB_PERSISTENT is not supported by this webtrees version")
+
+
+def probe_database() -> None:
+    """
+    Wait until the database server accepts connections, using the
+    configured host or socket and connection timeout
+    """
+    if ENV.dbtype not in [DBType.mysql, DBType.pgsql]:
+        return
+
+    if not check_db_variables():
+        return
+
+    # for typing, check_db_variables already does this
+    assert ENV.dbhost is not None
+
+    if ENV.dbsocket is not None:
+        target = ENV.dbsocket
+
+        if ENV.dbtype == DBType.pgsql:
+            # libpq takes the directory, and the socket is named after the port
+            socket_file = os.path.join(ENV.dbsocket, f".s.PGSQL.{ENV.dbport}")
+        else:
+            socket_file = ENV.dbsocket
+    else:
+        target = f"{ENV.dbhost}:{ENV.dbport}"
+
+    if ENV.dbtype == DBType.mysql:
+        # https://dev.mysql.com/doc/refman/8.0/en/mysqladmin.html#option_mysqladmin_user
+        # don't miss the capital P
+        cmd = ["mysqladmin", "ping", "--silent"]
+        cmd.extend(["--connect-timeout", ENV.dbconnecttimeout])
+
+        if ENV.dbsocket is not None:
+            cmd.extend(["--socket", ENV.dbsocket])
+        else:
+            cmd.extend(["-h", ENV.dbhost, "-P", ENV.dbport])
+
+        name = "MySQL"
+    elif ENV.dbtype == DBType.pgsql:
+        # https://www.postgresql.org/docs/current/app-pg-isready.html
+        cmd = ["pg_isready", "-h", ENV.dbhost, "-p", ENV.dbport, "--quiet"]
+        cmd.extend(["-t", ENV.dbconnecttimeout])
+        name = "PostgreSQL"
+
+    lookup_deadline = time.monotonic() + DB_LOOKUP_TIMEOUT
+
+    while True:
+        if ENV.dbsocket is not None:
+            # the socket may not exist yet if the server is still starting
+            if not os.path.exists(socket_file):
+                if time.monotonic() > lookup_deadline:
+                    print2(f"ERROR: Database socket {socket_file} does not exist")
+                    print2(
+                        "ERROR: You likely have the DB_SOCKET environment variable set incorrectly, or the socket is not mounted."
+                    )
+                    print2("ERROR: Exiting.")
+                    sys.exit(1)
+
+                print2(f"Waiting for database socket {socket_file} to exist")
+                time.sleep(1)
+                continue
+        else:
+            # try to resolve the host
+            # most common error is wrong hostname, but the database
+            # container may also not be up yet
+            try:
+                socket.gethostbyname(ENV.dbhost)
+            except socket.gaierror:
+                if time.monotonic() > lookup_deadline:
+                    print2(f"ERROR: Could not resolve database host '{ENV.dbhost}'")
+                    print2(
+                        "ERROR: You likely have the DB_HOST environment variable set incorrectly."
+                    )
+                    print2("ERROR: Exiting.")
+                    sys.exit(1)
+
+                print2(f"Waiting to resolve database host '{ENV.dbhost}'")
+                time.sleep(1)
+                continue
+
+        if subprocess.run(cmd).returncode == 0:
+            break
+
+        print2(f"Waiting for {name} server {target} to be ready")
+        time.sleep(1)
+
+    print2(f"{name} server {target} is ready")
+
+
 def setup_wizard() -> None:
     """
     Run the setup wizard
@@ -423,45 +738,8 @@ def setup_wizard() -> None:
     # run apache in the background
     apache_proc = subprocess.Popen(["apache2-foreground"], stderr=subprocess.DEVNULL)
 
-    if ENV.dbtype in [DBType.mysql, DBType.pgsql]:
-        # for typing, check_db_variables already does this
-        assert ENV.dbhost is not None
-
-        # try to resolve the host
-        # most common error is wrong hostname
-        try:
-            socket.gethostbyname(ENV.dbhost)
-        except socket.gaierror:
-            print2(f"ERROR: Could not resolve database host '{ENV.dbhost}'")
-            print2(
-                "ERROR: You likely have the DBHOST environment variable set incorrectly."
-            )
-            print2("ERROR: Exiting.")
-
-            # stop apache
-            apache_proc.terminate()
-            # die
-            sys.exit(1)
-
-        # wait until database is ready
-        if ENV.dbtype == DBType.mysql:
-            # https://dev.mysql.com/doc/refman/8.0/en/mysqladmin.html#option_mysqladmin_user
-            # don't miss the capital P
-            cmd = ["mysqladmin", "ping", "-h", ENV.dbhost, "-P", ENV.dbport, "--silent"]
-            name = "MySQL"
-        elif ENV.dbtype == DBType.pgsql:
-            # https://www.postgresql.org/docs/current/app-pg-isready.html
-            cmd = ["pg_isready", "-h", ENV.dbhost, "-p", ENV.dbport, "--quiet"]
-            name = "PostgreSQL"
-
-        while subprocess.run(cmd).returncode != 0:
-            print2(f"Waiting for {name} server {ENV.dbhost}:{ENV.dbport} to be ready")
-            time.sleep(1)
-
-    else:
-        # sqlite
-        # let Apache start up
-        time.sleep(2)
+    # the database was already probed at startup, so just let Apache start up
+    time.sleep(2)
 
     # send it
     url = "http://127.0.0.1:80/"
@@ -564,11 +842,292 @@ def htaccess() -> None:
     print2(f"Created {htaccess_file}")
 
 
-def main() -> None:
+def php_command(args: List[str]) -> List[str]:
+    """
+    Build a PHP command line with bulk-friendly PHP settings.
+    """
+    settings = dict(BULK_PHP_SETTINGS)
+    if ENV.dbtype == DBType.mysql:
+        settings.update(BULK_MYSQL_PHP_SETTINGS)
+
+    cmd = ["php"]
+    for key, value in settings.items():
+        cmd.extend(["-d", f"{key}={value}"])
+
+    return cmd + args
+
+
+def webtrees_cli(args: List[str]) -> int:
+    """
+    Run a webtrees command line command as the web server user,
+    with bulk-friendly PHP settings. Output is streamed as it runs.
+    """
+    cmd = php_command(["index.php", *args])
+
+    print2(f"Running {' '.join(cmd)}")
+    return subprocess.run(cmd, user="www-data", group="www-data").returncode
+
+
+def gedcom_import(filename: str, tree: str) -> None:
+    """
+    Import a GEDCOM file into a tree without going through a web request
+    """
+    if not os.path.isdir(CLI_DIR):
+        print2("ERROR: GEDCOM import requires webtrees 2.2 or later")
+        sys.exit(1)
+
+    if not os.path.isfile(CONFIG_FILE):
+        print2(f"ERROR: {CONFIG_FILE} does not exist. Complete setup first.")
+        sys.exit(1)
+
+    filename = os.path.abspath(filename)
+    if not os.path.isfile(filename):
+        print2(f"ERROR: {filename} is not a file")
+        sys.exit(1)
+
+    database_connection_options()
+
+    print2(f"Importing {filename} into tree {tree}")
+    start = time.monotonic()
+    returncode = webtrees_cli(["tree-import", tree, filename])
+
+    if returncode != 0:
+        print2(f"ERROR: Import failed with exit code {returncode}")
+        sys.exit(returncode)
+
+    print2(f"Import finished in {time.monotonic() - start:.1f} seconds")
+
+
+def cpu_quota() -> int:
+    """
+    Number of CPUs this container may use, taking the cgroup CPU quota
+    into account.
+    """
+    count = len(os.sched_getaffinity(0))
+
+    try:
+        # cgroup v2
+        with open("/sys/fs/cgroup/cpu.max", "r") as fp:
+            quota, period = fp.read().split()
+    except FileNotFoundError:
+        try:
+            # cgroup v1
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "r") as fp:
+                quota = fp.read().strip()
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", "r") as fp:
+                period = fp.read().strip()
+        except FileNotFoundError:
+            return count
+
+    if quota in ("max", "-1"):
+        return count
+
+    return max(1, min(count, math.ceil(int(quota) / int(period))))
+
+
+def scan_media(manifest: Dict[str, float]) -> List[str]:
+    """
+    Find media files, relative to the data directory, that are new or
+    have been modified since they were last recorded in the manifest.
+    """
+    changed = []
+
+    for dirpath, _, filenames in os.walk(MEDIA_DIR):
+        for filename in filenames:
+            if os.path.splitext(filename)[1].lower() not in MEDIA_EXTENSIONS:
+                continue
+
+            path = os.path.join(dirpath, filename)
+            relpath = os.path.relpath(path, DATA_DIR)
+
+            if manifest.get(relpath) != os.stat(path).st_mtime:
+                changed.append(relpath)
+
+    return sorted(changed)
+
+
+def media_warm_worker(
+    paths: List[str], sizes: List[str]
+) -> Tuple[Dict[str, float], List[str]]:
+    """
+    Generate thumbnails for the given paths in a single PHP process.
+    Returns the modification times of the paths that had thumbnails
+    generated, and the paths that failed.
+    """
+    done = {}
+    failed = []
+    processed = set()
+
+    # record the mtime before generating, so changes made while running
+    # are picked up next time
+    mtimes = {}
+    for p in paths:
+        try:
+            mtimes[p] = os.stat(os.path.join(DATA_DIR, p)).st_mtime
+        except FileNotFoundError:
+            # deleted since the scan
+            pass
+
+    paths = list(mtimes)
+    if not paths:
+        return done, failed
+
+    # feed the paths from a file rather than a pipe, so a long list
+    # can't deadlock against the output
+    with tempfile.TemporaryFile("w+") as fp:
+        fp.writelines(f"{p}\n" for p in paths)
+        fp.seek(0)
+
+        proc = subprocess.Popen(
+            php_command([MEDIA_WARM_SCRIPT, *sizes]),
+            stdin=fp,
+            stdout=subprocess.PIPE,
+            text=True,
+            user="www-data",
+            group="www-data",
+        )
+    assert proc.stdout is not None
+
+    for line in proc.stdout:
+        parts = line.rstrip("\n").split("\t", 2)
+
+        # anything else is output from PHP itself, such as a bootstrap error
+        if len(parts) != 3 or parts[0] not in mtimes:
+            print2(f"WARNING: Thumbnail worker: {line.rstrip()}")
+            continue
+
+        path, count, detail = parts
+        processed.add(path)
+
+        if count == "ERROR":
+            print2(f"WARNING: {path}: {detail}")
+            failed.append(path)
+            continue
+
+        try:
+            seconds = float(detail)
+            thumbnails = int(count)
+        except ValueError:
+            print2(f"WARNING: Thumbnail worker: {line.rstrip()}")
+            failed.append(path)
+            continue
+
+        print2(f"{path}: {thumbnails} thumbnails in {seconds:.2f} seconds")
+
+        # files not linked to a media record yet are left out of the manifest,
+        # so they are picked up once they are linked
+        if thumbnails > 0:
+            done[path] = mtimes[path]
+
+    returncode = proc.wait()
+    if returncode != 0:
+        print2(f"WARNING: Thumbnail worker exited with code {returncode}")
+
+    # the worker stopped before reaching these
+    failed.extend(p for p in paths if p not in processed)
+
+    return done, failed
+
+
+def media_warm(sizes: List[str], force: bool) -> None:
+    """
+    Pre-generate thumbnails for new or changed media files, so the first
+    visitors to a page do not have to wait for them.
+    """
+    if not os.path.isdir(CLI_DIR):
+        print2("ERROR: Thumbnail generation requires webtrees 2.2 or later")
+        sys.exit(1)
+
+    if not os.path.isfile(CONFIG_FILE):
+        print2(f"ERROR: {CONFIG_FILE} does not exist. Complete setup first.")
+        sys.exit(1)
+
+    database_connection_options()
+
+    manifest: Dict[str, float] = {}
+    if not force and os.path.isfile(MEDIA_WARM_MANIFEST):
+        with open(MEDIA_WARM_MANIFEST, "r") as fp:
+            manifest = json.load(fp)
+
+    paths = scan_media(manifest)
+    if not paths:
+        print2("No new or changed media files")
+        return
+
+    workers = min(cpu_quota(), len(paths))
+    print2(f"Generating thumbnails for {len(paths)} files with {workers} workers")
+
+    # webtrees caches each exact size, so generate every srcset density
+    all_sizes = []
+    for size in sizes:
+        dimensions, fit = size.split(":")
+        width, height = (int(d) for d in dimensions.split("x"))
+        all_sizes.extend(
+            f"{width * x}x{height * x}:{fit}" for x in MEDIA_WARM_DENSITIES
+        )
+
+    # spread files across the workers round-robin
+    chunks = [paths[i::workers] for i in range(workers)]
+    start = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda c: media_warm_worker(c, all_sizes), chunks))
+
+    # drop files that no longer exist
+    manifest = {
+        p: m for p, m in manifest.items() if os.path.isfile(os.path.join(DATA_DIR, p))
+    }
+    failed = []
+    for done, chunk_failed in results:
+        manifest.update(done)
+        failed.extend(chunk_failed)
+
+    with open(MEDIA_WARM_MANIFEST, "w") as fp:
+        json.dump(manifest, fp)
+
+    succeeded = sum(len(done) for done, _ in results)
+    print2(
+        f"Generated thumbnails for {succeeded} of {len(paths)} files"
+        f" in {time.monotonic() - start:.1f} seconds"
+    )
+
+    if failed:
+        print2(f"ERROR: {len(failed)} files were not processed:")
+        for path in sorted(failed):
+            print2(f"  {path}")
+        sys.exit(1)
+
+
+def primary() -> TextIO:
+    """
+    Set up the shared data directory. Replicas wait for this to finish.
+    Returns the lock file, which must be kept open while the primary runs
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+
+    # don't truncate before locking, as another primary may still be running
+    lock = open(LOCK_FILE, "a+")
+    print2(f"Waiting for lock on {LOCK_FILE}")
+    fcntl.flock(lock, fcntl.LOCK_EX)
+
+    # replicas only trust a marker with the token of the primary holding the lock,
+    # so a marker left over from a previous run is ignored
+    token = uuid.uuid4().hex
+    lock.seek(0)
+    lock.truncate()
+    lock.write(token)
+    lock.flush()
+
+    if os.path.isfile(READY_FILE):
+        os.remove(READY_FILE)
+
     # first, set up permissions
     perms()
     # create php config
     php_ini()
+    database_connection_options()
+    # wait for the database
+    probe_database()
     # run the setup wizard if the config file doesn't exist
     setup_wizard()
     # update the config file
@@ -580,9 +1139,112 @@ def main() -> None:
     # set up permissions again
     perms()
 
+    with open(READY_FILE, "w") as fp:
+        fp.write(token)
+
+    return lock
+
+
+def primary_ready() -> bool:
+    """
+    Check if a running primary has finished setting up the data directory
+    """
+    if not os.path.isfile(LOCK_FILE):
+        return False
+
+    with open(LOCK_FILE, "r") as lock:
+        try:
+            # only succeeds if no primary holds the lock
+            fcntl.flock(lock, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # a primary is running, so check the marker is from this run of it
+            token = lock.read()
+        else:
+            # no primary is running, so any marker is left over from a previous run
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            return False
+
+    if not token or not os.path.isfile(READY_FILE):
+        return False
+
+    with open(READY_FILE, "r") as fp:
+        return fp.read() == token
+
+
+def replica() -> None:
+    """
+    Set up only this container, and leave the shared data directory alone
+    """
+    if ENV.dbtype == DBType.sqlite:
+        print2("ERROR: ROLE=replica can not be used with an SQLite database")
+        sys.exit(1)
+
+    # only configure the local user, as the primary owns the data directory
+    user_ids()
+    # create php config
+    php_ini()
+    database_connection_options()
+
+    while not primary_ready():
+        print2(f"Waiting for the primary to create {READY_FILE}")
+        time.sleep(1)
+
+    # wait for the database
+    probe_database()
+    # configure https
+    https()
+
+
+def main() -> None:
+    # show how the environment was configured
+    ENV.report()
+
+    # keep the primary's lock open until Apache exits
+    lock = None
+
+    if ENV.role == Role.primary:
+        lock = primary()
+    else:
+        replica()
+
     print2("Starting Apache")
     subprocess.run(["apache2-foreground"], stderr=subprocess.DEVNULL)
 
+    if lock is not None:
+        lock.close()
+
 
 if __name__ == "__main__":
-    main()
+    os.chdir(ROOT)
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command")
+
+    import_parser = subparsers.add_parser("import", help="Import a GEDCOM file")
+    import_parser.add_argument("file", type=str, help="GEDCOM file to import")
+    import_parser.add_argument("--tree", type=str, required=True, help="Tree name")
+
+    warm_parser = subparsers.add_parser(
+        "media-warm", help="Pre-generate thumbnails for new or changed media"
+    )
+    warm_parser.add_argument(
+        "--size",
+        type=str,
+        action="append",
+        help=(
+            "Thumbnail size as WIDTHxHEIGHT:FIT, generated at each srcset density."
+            f" Default: {', '.join(MEDIA_WARM_SIZES)}"
+        ),
+    )
+    warm_parser.add_argument(
+        "--force", action="store_true", help="Ignore the manifest and process all files"
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "import":
+        gedcom_import(filename=args.file, tree=args.tree)
+    elif args.command == "media-warm":
+        media_warm(sizes=args.size or MEDIA_WARM_SIZES, force=args.force)
+    else:
+        main()
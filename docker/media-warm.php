@@ -0,0 +1,101 @@
+<?php
+
+// Pre-generate webtrees thumbnails for media files.
+// Paths relative to the data directory are read from stdin, one per line.
+// Thumbnail sizes are given as arguments, in the form WIDTHxHEIGHT:FIT.
+// For each path, a line of "path<TAB>thumbnail count<TAB>seconds" is written
+// to stdout, or "path<TAB>ERROR<TAB>message" on failure.
+
+declare(strict_types=1);
+
+use Fisharebest\Webtrees\DB;
+use Fisharebest\Webtrees\Registry;
+use Fisharebest\Webtrees\Services\TreeService;
+use Fisharebest\Webtrees\Webtrees;
+
+chdir('/var/www/webtrees');
+require 'vendor/autoload.php';
+
+$webtrees = new Webtrees();
+$webtrees->bootstrap();
+
+$config = parse_ini_file(Webtrees::CONFIG_FILE);
+
+DB::connect(
+    $config['dbtype'] ?? 'mysql',
+    $config['dbhost'] ?? '',
+    $config['dbport'] ?? '',
+    $config['dbname'] ?? '',
+    $config['dbuser'] ?? '',
+    $config['dbpass'] ?? '',
+    $config['tblpfx'] ?? '',
+    $config['dbkey'] ?? '',
+    $config['dbcert'] ?? '',
+    $config['dbca'] ?? '',
+    (bool) ($config['dbverify'] ?? ''),
+);
+
+$sizes = [];
+foreach (array_slice($argv, 1) as $arg) {
+    [$dimensions, $fit] = explode(':', $arg);
+    [$width, $height] = explode('x', $dimensions);
+    $sizes[] = [(int) $width, (int) $height, $fit];
+}
+
+$trees = Registry::container()->get(TreeService::class)->all();
+$image_factory = Registry::imageFactory();
+
+while (($line = fgets(STDIN)) !== false) {
+    $path = trim($line);
+
+    if ($path === '') {
+        continue;
+    }
+
+    $start = microtime(true);
+    $count = 0;
+
+    try {
+        foreach ($trees as $tree) {
+            $media_directory = $tree->getPreference('MEDIA_DIRECTORY', 'media/');
+
+            if (!str_starts_with($path, $media_directory)) {
+                continue;
+            }
+
+            $filename = substr($path, strlen($media_directory));
+
+            $xrefs = DB::table('media_file')
+                ->where('m_file', '=', $tree->id())
+                ->where('multimedia_file_refn', '=', $filename)
+                ->pluck('m_id');
+
+            foreach ($xrefs as $xref) {
+                $media = Registry::mediaFactory()->make($xref, $tree);
+
+                if ($media === null) {
+                    continue;
+                }
+
+                foreach ($media->mediaFiles() as $media_file) {
+                    if ($media_file->filename() !== $filename || !$media_file->isImage()) {
+                        continue;
+                    }
+
+                    // visitors may or may not see a watermark, depending on the tree settings
+                    foreach ($sizes as [$width, $height, $fit]) {
+                        foreach ([false, true] as $add_watermark) {
+                            $image_factory->mediaFileThumbnailResponse($media_file, $width, $height, $fit, $add_watermark);
+                            $count++;
+                        }
+                    }
+                }
+            }
+        }
+    } catch (Throwable $ex) {
+        printf("%s\tERROR\t%s\n", $path, str_replace(["\t", "\n"], ' ', $ex->getMessage()));
+        continue;
+    }
+
+    printf("%s\t%d\t%.3f\n", $path, $count, microtime(true) - $start);
+}